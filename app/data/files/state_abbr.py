@@ -1,3 +1,5 @@
+from types import MappingProxyType
+
 us_state_abbrev = {
     'Alabama': 'AL',
     'Alaska': 'AK',
@@ -60,8 +62,20 @@ us_state_abbrev = {
 # thank you to @kinghelix and @trevormarburger for this idea
 abbrev_us_state = dict(map(reversed, us_state_abbrev.items()))
 
+# read-only lookup on lowercased state names
+_us_state_abbrev_lower = MappingProxyType({k.lower(): v for k, v in us_state_abbrev.items()})
+
+
+def to_abbr(name):
+    """Return the two-letter abbreviation for a state name in any case.
+
+    Raises KeyError for an unknown state.
+    """
+    return _us_state_abbrev_lower[name.strip().lower()]
+
 # Simple test examples
 if __name__ == '__main__':
     print("Wisconin --> WI?", us_state_abbrev['Wisconsin'] == 'WI')
     print("WI --> Wisconin?", abbrev_us_state['WI'] == 'Wisconsin')
+    print("new york --> NY?", to_abbr('new york') == 'NY')
     print("Number of entries (50 states, DC, 5 Territories) == 56? ", 56 == len(us_state_abbrev))
\ No newline at end of file
@@ -1,20 +1,166 @@
-import requests
+import asyncio
+import httpx
+import orjson
 import os
 import datetime
-import pandas as pd
-import json
+import hashlib
+import time
+from collections import defaultdict
+from functools import lru_cache
+from urllib.parse import urlencode
 from pickle import load
-from bs4 import BeautifulSoup
-from fastapi import APIRouter, HTTPException, Depends
-from pydantic import BaseModel, BaseSettings, SecretStr
+from async_lru import alru_cache
+from selectolax.lexbor import LexborHTMLParser
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential, wait_random
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.responses import ORJSONResponse
 from app.ml import City, validate_city
-from app.data.files.state_abbr import us_state_abbrev as abbr
-from dotenv import dotenv_values, load_dotenv
+from dotenv import load_dotenv
 
 router = APIRouter()
 load_dotenv()
 
 weather_api = os.getenv("WEATHER_API_KEY")
+rental_api = os.getenv("RENTAL_API_KEY")
+
+# Shared async client so outbound calls don't block the event loop.
+# Idle connections to indeed/openweathermap are kept alive between requests.
+client = httpx.AsyncClient(
+    http2=True,
+    timeout=10,
+    follow_redirects=True,
+    limits=httpx.Limits(
+        max_connections=100,
+        max_keepalive_connections=20,
+        keepalive_expiry=75)
+)
+
+
+@router.on_event("shutdown")
+async def close_client():
+    await client.aclose()
+
+
+# Per upstream host: consecutive failed calls, when its circuit opened, and
+# whether the single half-open trial call is in flight
+circuit_breakers = defaultdict(lambda: {"failures": 0, "opened_at": None, "probing": False})
+BREAKER_FAIL_MAX = 5
+BREAKER_RESET_TIMEOUT = 30
+
+
+async def get_upstream(http_client, url, **kwargs):
+    """GET a url once through its host's circuit breaker
+
+    After BREAKER_FAIL_MAX consecutive failed calls to a host its circuit opens
+    and calls fail fast for BREAKER_RESET_TIMEOUT seconds. Then one trial call
+    is let through: success closes the circuit, failure reopens it.
+
+    args:
+    - http_client: the httpx.AsyncClient to send the request with
+    - url: the url to fetch
+    - kwargs: passed through to `http_client.get` (params, headers, ...)
+
+    returns:
+    - httpx.Response
+
+    raises:
+    - HTTPException: 503 while the host's circuit is open
+    - httpx.TransportError, httpx.HTTPStatusError: on connection errors, throttling and 5xx responses
+    """
+
+    host = httpx.URL(url).host
+    breaker = circuit_breakers[host]
+    trial = False
+
+    if breaker["opened_at"] is not None:
+        if breaker["probing"] or time.monotonic() < breaker["opened_at"] + BREAKER_RESET_TIMEOUT:
+            raise HTTPException(status_code=503, detail=f"{host} is temporarily unavailable")
+        breaker["probing"] = trial = True
+
+    try:
+        response = await http_client.get(url, **kwargs)
+        if response.status_code == 429 or response.status_code >= 500:
+            response.raise_for_status()
+    except (httpx.TransportError, httpx.HTTPStatusError):
+        # state is read here, after the await, so concurrent failures all count
+        breaker["failures"] += 1
+        if trial or breaker["failures"] >= BREAKER_FAIL_MAX:
+            breaker["opened_at"] = time.monotonic()
+        raise
+    finally:
+        if trial:
+            breaker["probing"] = False
+
+    breaker["failures"] = 0
+    breaker["opened_at"] = None
+    return response
+
+
+# Retries stop early once the circuit opens, as get_upstream then raises HTTPException
+get_with_retry = retry(
+    stop=stop_after_attempt(3),
+    wait=wait_exponential(multiplier=0.1, max=2) + wait_random(0, 0.1),
+    retry=retry_if_exception_type((httpx.TransportError, httpx.HTTPStatusError)),
+    reraise=True)(get_upstream)
+
+
+async def fetch(http_client, url, **kwargs):
+    """GET a url, retrying with backoff behind a per-host circuit breaker
+
+    args:
+    - http_client: the httpx.AsyncClient to send the request with
+    - url: the url to fetch
+    - kwargs: passed through to `http_client.get` (params, headers, ...)
+
+    returns:
+    - httpx.Response
+
+    raises:
+    - HTTPException: 503 while the host's circuit is open, 502 once retries are exhausted
+    """
+
+    try:
+        return await get_with_retry(http_client, url, **kwargs)
+    except (httpx.TransportError, httpx.HTTPStatusError):
+        raise HTTPException(status_code=502, detail=f"{httpx.URL(url).host} did not respond")
+
+
+@lru_cache(maxsize=4)
+def format_date(minute, fmt):
+    """Format today's date, cached per `minute` bucket"""
+    return datetime.date.today().strftime(fmt)
+
+def today_str(fmt):
+    """Today's date formatted with `fmt`, recomputed at most once a minute"""
+    return format_date(int(time.time()) // 60, fmt)
+
+
+def cacheable_response(request, data, max_age):
+    """Wrap data in a JSON response carrying Cache-Control and ETag headers
+
+    Only for GET routes: browsers and CDNs don't store POST responses, and a
+    conditional POST must not be answered with a 304.
+
+    args:
+    - request: the incoming GET request, checked for a matching If-None-Match
+    - data: the JSON serializable response content
+    - max_age: number of seconds clients may reuse the response
+
+    returns:
+    - ORJSONResponse, or an empty 304 response when the client already has this body
+    """
+
+    response = ORJSONResponse(content=data)
+    etag = 'W/"' + hashlib.md5(response.body).hexdigest() + '"'
+    headers = {"Cache-Control": f"public, max-age={max_age}", "ETag": etag}
+
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    response.headers.update(headers)
+    return response
+
 
 # Weather Endpoint
 # https://github.com/juhilsomaiya/API-Integrations-Python/blob/master/Weather_forecast/main.p
@@ -38,18 +184,61 @@ async def current_weather(city:City):
     - Dictionary that contains the requested data, which is converted by fastAPI to a json object.
     """
 
-    app_id = weather_api
     location = validate_city(city) # {city: "New York", state: "NY" }
-    city_name = location.city + "," + location.state
-    county_code = "US"
-    api_call = 'http://api.openweathermap.org/data/2.5/weather?q=' + city_name + ',' + county_code + '&appid=' + app_id + '&mode=json&units=imperial'
-    data = requests.get(api_call)
+    return await get_weather(location.city, location.state)
+
+
+@router.get('/api/temperature')
+async def current_weather_by_query(request:Request, city: str="New York", state: str="NY"):
+    """Retrieve current weather data from openweathermap, cacheable by clients
+
+    Same data as POST /api/temperature, with the city in the query string so
+    browsers and CDNs can store it. Cache-Control max-age covers only what is
+    left of the 5 minute memo, and a matching If-None-Match gets an empty 304.
+
+    args:
+    - city: The target city
+    - state: The target state
+
+    returns:
+    - Dictionary that contains the requested data, which is converted by fastAPI to a json object.
+    """
+
+    location = validate_city(City(city=city, state=state))
+    fetched_at, weather = await fetch_weather(location.city, location.state)
+    max_age = max(0, int(WEATHER_TTL - (time.monotonic() - fetched_at)))
+    return cacheable_response(request, weather, max_age=max_age)
+
+
+async def get_weather(city, state):
+    """Current weather for a validated city and state abbr"""
+
+    return (await fetch_weather(city, state))[1]
+
 
-    data = data.json()
+# The only cache in front of openweathermap, so weather is at most 5 minutes old
+WEATHER_TTL = 300
+
+@alru_cache(maxsize=1024, ttl=WEATHER_TTL)
+async def fetch_weather(city, state):
+    """Fetch and format current weather for a validated city and state abbr
+
+    returns:
+    - (time.monotonic() when fetched, weather dictionary)
+    """
+
+    params = {
+        "q": f"{city},{state},US",
+        "appid": weather_api,
+        "mode": "json",
+        "units": "imperial"}
+    api_call = 'http://api.openweathermap.org/data/2.5/weather'
+    data = await fetch(client, api_call, params=params)
+
+    data = orjson.loads(data.content)
     main = data['main']
-    today = datetime.datetime.today()
-    return {
-        "Date": today.strftime("%m/%d/%y"),
+    return time.monotonic(), {
+        "Date": today_str("%m/%d/%y"),
         "Description": data['weather'][0]['description'],
         "Temperature": str(main['temp'])+" F\N{DEGREE SIGN}",
         "High Today": str(main['temp_max'])+" F\N{DEGREE SIGN}",
@@ -64,7 +253,7 @@ async def current_weather(city:City):
 # Jobs Endpoint
 # https://github.com/israel-dryer/Indeed-Job-Scraper/blob/master/indeed-job-scraper.ipynb
 @router.post('/api/job_opportunities')
-async def job_opportunities(position, city:City):
+async def job_opportunities(position, city:City, full_description: bool=False):
     """Returns jobs opportunities from indeed.com
     Fetch first 10 job opportunities
     - Job title,
@@ -78,32 +267,79 @@ async def job_opportunities(position, city:City):
     args:
     - position: desired job opportunity
     - city: target city
+    - full_description: fetch each listing's page for the complete description
     returns:
     - Dictionary that contains the requested data, which is converted by fastAPI to a json object.
     """
 
-    # Run the main program routing
-    records = []  # creating the record list
-
     city_name = validate_city(city)
     location = city_name.city + ' ' + city_name.state
     url = get_url(position, location)  # create the url while passing in the position and location.
 
-    response = requests.get(url)
-    soup = BeautifulSoup(response.text, 'html.parser')
-    cards = soup.find_all('div', 'jobsearch-SerpJobCard')
+    response = await fetch(client, url)
+
+    # Parse in a worker thread to keep the event loop free
+    loop = asyncio.get_running_loop()
+    jobs = await loop.run_in_executor(None, parse_jobs, response.content)
+
+    if full_description:
+        records = jobs["Top 10 Listings"]
+        descriptions = await asyncio.gather(
+            *(get_job_description(record['Job Url']) for record in records))
+        for record, description in zip(records, descriptions):
+            record['Description'] = description or record['Description']
+
+    return jobs
+
+# Limit concurrent detail page requests to indeed
+job_page_semaphore = asyncio.Semaphore(10)
+
+async def get_job_description(url):
+    """Fetch the full description from a job listing page
+
+    The description is optional, so a failed page returns '' and the
+    listing keeps its search result summary. Detail pages skip `fetch`'s
+    retries and circuit breaker, so their failures can't open the
+    www.indeed.com circuit the search page depends on.
+    """
+
+    if not url:
+        return ''
+
+    try:
+        async with job_page_semaphore:
+            response = await client.get(url)
+        response.raise_for_status()
+    except httpx.HTTPError:
+        return ''
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, parse_job_description, response.content)
+
+def parse_job_description(body):
+    """Extract the description text from an indeed job page"""
+
+    description = LexborHTMLParser(body).css_first('div#jobDescriptionText')
+    return description.text(separator='\n', strip=True) if description else ''
+
+def parse_jobs(body):
+    """Extract the job records and total job count from an indeed search page"""
+
+    records = []  # creating the record list
+
+    tree = LexborHTMLParser(body)
+    cards = tree.css('div.jobsearch-SerpJobCard')
 
     for card in cards:
         record = get_record(card)
         records.append(record)
 
     #also return total number of jobs
-    try:
-        total_jobs = soup.find('div', id='searchCountPages').text.strip()
-        total = total_jobs.split()[-2:]
+    total_jobs = tree.css_first('div#searchCountPages')
+    if total_jobs:
+        total = total_jobs.text().strip().split()[-2:]
         jobs = ' '.join(total)
-    except AttributeError:
-        total_jobs = ''
+    else:
         jobs = ''
 
     return {"Search Results":jobs, "Top 10 Listings": records}
@@ -111,40 +347,28 @@ async def job_opportunities(position, city:City):
 def get_record(card):
     """Extract job date from a single record"""
 
-    atag = card.h2.a
-    try:
-        job_title = atag.get('title')
-    except AttributeError:
-        job_title = ''
+    atag = card.css_first('h2 a')
+    job_title = (atag.attributes.get('title') or '') if atag else ''
 
-    try:
-        company = card.find('span', 'company').text.strip()
-    except AttributeError:
-        company = ''
+    company = card.css_first('span.company')
+    company = company.text().strip() if company else ''
 
-    try:
-        job_location = card.find('div', 'recJobLoc').get('data-rc-loc')
-    except AttributeError:
-        job_location = ''
+    job_location = card.css_first('div.recJobLoc')
+    job_location = (job_location.attributes.get('data-rc-loc') or '') if job_location else ''
 
-    try:
-        job_summary = card.find('div', 'summary').text.strip()
-    except AttributeError:
-        job_summary = ''
+    job_summary = card.css_first('div.summary')
+    job_summary = job_summary.text().strip() if job_summary else ''
 
-    try:
-        post_date = card.find('span', 'date').text.strip()
-    except AttributeError:
-        post_date = ''
+    post_date = card.css_first('span.date')
+    post_date = post_date.text().strip() if post_date else ''
 
-    try:
-        salary = card.find('span', 'salarytext').text.strip()
-    except AttributeError:
-        salary = ''
+    salary = card.css_first('span.salarytext')
+    salary = salary.text().strip() if salary else ''
 
-    extract_date = datetime.datetime.today().strftime('%Y-%m-%d')
+    extract_date = today_str('%Y-%m-%d')
 
-    job_url = 'https://www.indeed.com' + atag.get('href')
+    href = atag.attributes.get('href') if atag else None
+    job_url = 'https://www.indeed.com' + href if href else ''
 
     record = {'Job Title': job_title,
               'Company': company,
@@ -160,36 +384,33 @@ def get_record(card):
 def get_url(position, location):
     "Generate a url based on position and location"
 
-    template = "https://www.indeed.com/jobs?q={}&l={}"
-    url = template.format(position, location)
+    url = "https://www.indeed.com/jobs?" + urlencode({"q": position, "l": location})
 
     return url
 
 
 # Rental Listings Endpoint
-class Settings(BaseSettings):
+headers={'x-rapidapi-key': rental_api,
+            'x-rapidapi-host':  "realtor-com-real-estate.p.rapidapi.com"}
 
-    RENTAL_API_KEY: SecretStr
+# All rental calls go to one RapidAPI host, multiplex them over a single HTTP/2 connection
+rapid_client = httpx.AsyncClient(http2=True, headers=headers, timeout=10)
 
-    class Config:
-        env_file = ".env"
 
-settings = Settings()
+@router.on_event("shutdown")
+async def close_rapid_client():
+    await rapid_client.aclose()
 
-headers={'x-rapidapi-key': os.getenv("RENTAL_API_KEY"),
-            'x-rapidapi-host':  "realtor-com-real-estate.p.rapidapi.com"}
 
 @router.post('/api/rental_listing')
 async def rental_listing(
             city:City,
-            api_key=settings.RENTAL_API_KEY,
             beds_min: int=1,
             baths_min: int=1,
             prop_type: str="apartment",
             limit: int=5):
     """
     args:
-    - api_key
     - city: str
     - state: str Two-letter abbreviation
     - beds_min: int number of minimum bedrooms
@@ -218,61 +439,70 @@ async def rental_listing(
                 "sort": "relevance",
                 "prop_type": prop_type}
 
-    response_for_rent=requests.request("GET", url, params=querystring, headers=headers)
-    response = response_for_rent.json()['data']['results']
-
-    rental_list=[]
-
-    for i in range(limit):
-        lat = response[i]['location']['address']['coordinate']['lat']
-        lon  = response[i]['location']['address']['coordinate']['lon']
-        line = response[i]['location']['address']['line']
-        city = response[i]['location']['address']['city']
-        state = response[i]['location']['address']['state']
-        pet_policy = response[i]['pet_policy']
-        try:
-            baths = response[i]['description']['baths_max']
-        except AttributeError:
-            baths = 0
-        try:
-            bedrooms = response[i]['description']['beds_max']
-        except AttributeError:
-            bedrooms = 0
-        if pet_policy != None:
-            cats_allowed = response[i]['pet_policy']['cats']
-        else:
-            cats_allowed = 'Unknown'
-        if pet_policy != None:
-            dogs_allowed = response[i]['pet_policy']['dogs']
+    response_for_rent = await fetch(rapid_client, url, params=querystring)
+    response = orjson.loads(response_for_rent.content)['data']['results']
+
+    return [get_rental(result) for result in response[:limit]]
+
+def get_rental(result):
+    """Extract rental data from a single realtor result"""
+
+    address = result['location']['address']
+    coordinate = address['coordinate']
+    description = result.get('description') or {}
+    pet_policy = result.get('pet_policy') or {}
+
+    return {
+        'Latitude': coordinate['lat'],
+        'Longitude': coordinate['lon'],
+        'Street Address': address['line'],
+        'City': address['city'],
+        'State': address['state'],
+        'Bedrooms': description.get('beds_max', 0),
+        'Bathrooms': description.get('baths_max', 0),
+        'Cats Allowed': pet_policy.get('cats', 'Unknown'),
+        'Dogs Allowed': pet_policy.get('dogs', 'Unknown'),
+        'List Price': result['list_price_max'],
+        'Ammenities': result.get('tags', []),
+        'Photos': result.get('photos'),
+    }
+
+
+# City Dashboard Endpoint
+@router.post('/api/city_dashboard')
+async def city_dashboard(position, city:City):
+    """Returns weather, job opportunities and rental listings for a city
+
+    The three upstream requests are issued concurrently on the shared client,
+    so the response takes as long as the slowest of them. An upstream that
+    fails leaves its section null, with the reason under "Errors", instead of
+    failing the whole dashboard.
+
+    args:
+    - position: desired job opportunity
+    - city: target city
+
+    returns:
+    - Dictionary that contains the requested data, which is converted by fastAPI to a json object.
+    """
+
+    city = validate_city(city)
+    sections = ("Weather", "Jobs", "Rentals")
+    results = await asyncio.gather(
+        get_weather(city.city, city.state),
+        job_opportunities(position, city),
+        rental_listing(city),
+        return_exceptions=True)
+
+    dashboard = {"Errors": {}}
+    for section, result in zip(sections, results):
+        if isinstance(result, Exception):
+            dashboard[section] = None
+            dashboard["Errors"][section] = result.detail if isinstance(result, HTTPException) else "Upstream error"
         else:
-            dogs_allowed = 'Unknown'
-        list_price = response[i]['list_price_max']
-        try:
-            ammenities = response[i]['tags']
-        except AttributeError:
-            ammenities = []
-        try:
-            photos = response[i]['photos']
-        except AttributeError:
-            photos = None
-
-        elements={
-            'Latitude': lat,
-            'Longitude': lon,
-            'Street Address': line,
-            'City': city,
-            'State': state,
-            'Bedrooms': bedrooms,
-            'Bathrooms': baths,
-            'Cats Allowed': cats_allowed,
-            'Dogs Allowed': dogs_allowed,
-            'List Price': list_price,
-            'Ammenities': ammenities,
-            'Photos': photos,
-      }
-        rental_list.append(elements)
-
-    return rental_list
+            dashboard[section] = result
+
+    return dashboard
 
 
 # Schools Listing Endpoint
@@ -295,7 +525,35 @@ async def schools_listings(current_city:City, school_category):
     - returns first 25 schools for speed
     """
 
-    city = validate_city(current_city)
+    return get_school_listing(validate_city(current_city), school_category)
+
+
+@router.get('/api/schools_listing')
+async def schools_listings_by_query(request:Request, school_category, city: str="New York", state: str="NY"):
+    """
+    Listing of school information for the city, cacheable by clients
+
+    Same data as POST /api/schools_listing, with the city in the query string
+    so browsers and CDNs can store it for a day; a matching If-None-Match
+    gets an empty 304.
+
+    args:
+    - city
+    - state
+    - school category -> pre-k, elementary, middle school, high school
+
+    returns:
+    - first 25 schools as a list of records
+    """
+
+    city = validate_city(City(city=city, state=state))
+    # school data only changes on redeploy
+    return cacheable_response(request, get_school_listing(city, school_category), max_age=86400)
+
+
+def get_school_listing(city, school_category):
+    """First 25 schools of a category for a validated city, as records"""
+
     city_name = city.city + ', ' + city.state
 
     if school_category == 'pre-k':
@@ -311,4 +569,4 @@ async def schools_listings(current_city:City, school_category):
         high = load(open("app/data/pickle_model/high.pkl", "rb"))
         school_listing = high[city_name][:25]
 
-    return school_listing.to_dict('records')
\ No newline at end of file
+    return school_listing.to_dict('records')
@@ -1,4 +1,5 @@
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 
@@ -20,6 +21,7 @@ app = FastAPI(
     title="CITYSPIRE API",
     description=description,
     docs_url="/",
+    default_response_class=ORJSONResponse,
 )
 
 app.include_router(db.router, tags=["Database"])
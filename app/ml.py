@@ -1,20 +1,34 @@
 """Machine learning functions"""
 from pickle import load
-import requests
-from bs4 import BeautifulSoup as bs
+import httpx
+import re
+from bs4 import BeautifulSoup as bs, SoupStrainer
 from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
-from app.data.files.state_abbr import us_state_abbrev as abbr
+from app.data.files.state_abbr import to_abbr
 from pathlib import Path
 import pandas as pd
 from pypika import Query, Table, CustomFunction
 import asyncio
 from app.db import database, select, select_all
-from typing import List, Optional
+from typing import List, Optional, Tuple
+from functools import lru_cache
 
 
 router = APIRouter()
 
+# Reused across requests so walkscore.com lookups share keep-alive connections
+client = httpx.AsyncClient(http2=True, timeout=10, follow_redirects=True)
+
+
+@router.on_event("shutdown")
+async def close_client():
+    await client.aclose()
+
+# Only the score badges are kept when parsing a walkscore.com page
+WALKSCORE_BADGES = SoupStrainer(class_=re.compile(r"\bblock-header-badge\b"))
+
+
 class City(BaseModel):
     city: str = "New York"
     state: str = "NY"
@@ -87,18 +101,37 @@ def validate_city(
     - HTTPException: If the state cannot be converted into an ABBR
     """
 
-    city.city = city.city.title()
+    city.city, city.state = normalize_city(city.city, city.state)
+
+    return city
+
+
+@lru_cache(maxsize=4096)
+def normalize_city(city: str, state: str) -> Tuple[str, str]:
+    """Title Case a city name and convert its state to an All Caps ABBR.
+
+    Cached, as every endpoint validates the same handful of popular cities.
+
+    args:
+    - city: The city name
+    - state: The state name or abbreviation
+
+    returns:
+    - a (city, state) tuple in the proper format
+
+    raises:
+    - HTTPException: If the state cannot be converted into an ABBR
+    """
 
     try:
-        if len(city.state) > 2:
-            city.state = city.state.title()
-            city.state = abbr[city.state]
+        if len(state) > 2:
+            state = to_abbr(state)
         else:
-            city.state = city.state.upper()
+            state = state.upper()
     except KeyError:
-        raise HTTPException(status_code=422, detail=f"Unknown state: '{city.state}'")
+        raise HTTPException(status_code=422, detail=f"Unknown state: '{state.title()}'")
 
-    return city
+    return city.title(), state
 
 
 @router.post("/api/get_data", response_model=CityData)
@@ -284,8 +317,9 @@ async def get_walkscore(city: str, state: str):
         List containing WalkScore, BusScore, and BikeScore in that order
     """
 
-    r_ = requests.get(f"https://www.walkscore.com/{state}/{city}")
-    images = bs(r_.text, features="lxml").select(".block-header-badge img")
+    r_ = await client.get(f"https://www.walkscore.com/{state}/{city}")
+    soup = bs(r_.content, features="lxml", parse_only=WALKSCORE_BADGES)
+    images = soup.select(".block-header-badge img")
     return [int(str(x)[10:12]) for x in images]
 
 
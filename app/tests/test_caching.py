@@ -0,0 +1,66 @@
+import os
+import unittest
+
+import httpx
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+# app modules read these at import time
+os.environ.setdefault("DATABASE_URL", "postgresql://localhost/cityspire")
+os.environ.setdefault("RENTAL_API_KEY", "test")
+
+from app import external
+
+WEATHER = {
+    "weather": [{"description": "clear sky"}],
+    "main": {"temp": 70, "temp_max": 75, "temp_min": 65, "humidity": 40,
+             "feels_like": 69, "pressure": 1015},
+    "wind": {"speed": 5},
+}
+
+
+class TestWeatherCaching(unittest.TestCase):
+    def setUp(self):
+        external.circuit_breakers.clear()
+        external.fetch_weather.cache_clear()
+        self.calls = 0
+
+        def openweathermap(request):
+            self.calls += 1
+            return httpx.Response(200, json=WEATHER)
+
+        self.client = external.client
+        external.client = httpx.AsyncClient(transport=httpx.MockTransport(openweathermap))
+
+        app = FastAPI()
+        app.include_router(external.router)
+        self.app = TestClient(app)
+
+    def tearDown(self):
+        external.client = self.client
+        external.fetch_weather.cache_clear()
+
+    def test_get_carries_cache_headers(self):
+        response = self.app.get('/api/temperature', params={"city": "new york", "state": "ny"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["Description"], "clear sky")
+        self.assertIn("ETag", response.headers)
+        max_age = int(response.headers["Cache-Control"].split("max-age=")[1])
+        self.assertLessEqual(max_age, external.WEATHER_TTL)
+
+    def test_matching_etag_gets_304(self):
+        params = {"city": "New York", "state": "NY"}
+        etag = self.app.get('/api/temperature', params=params).headers["ETag"]
+        response = self.app.get('/api/temperature', params=params,
+                                headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+        self.assertEqual(self.calls, 1)
+
+    def test_post_is_not_cacheable(self):
+        response = self.app.post('/api/temperature',
+                                 json={"city": "New York", "state": "NY"},
+                                 headers={"If-None-Match": "*"})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("ETag", response.headers)
+        self.assertNotIn("Cache-Control", response.headers)
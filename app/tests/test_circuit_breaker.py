@@ -0,0 +1,156 @@
+import asyncio
+import os
+import unittest
+
+import httpx
+
+# app modules read these at import time
+os.environ.setdefault("DATABASE_URL", "postgresql://localhost/cityspire")
+os.environ.setdefault("RENTAL_API_KEY", "test")
+
+from app import external
+from app.ml import City
+
+URL = "https://api.example.com/data"
+
+
+class UpstreamTransport(httpx.AsyncBaseTransport):
+    """Answers every request with `status`, counting calls"""
+
+    def __init__(self, status, delay=0):
+        self.status = status
+        self.delay = delay
+        self.calls = 0
+
+    async def handle_async_request(self, request):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return httpx.Response(self.status)
+
+
+def fetch_status(transport, count=1):
+    """Run `count` concurrent fetches and return their status codes"""
+
+    async def run():
+        async with httpx.AsyncClient(transport=transport) as client:
+            results = await asyncio.gather(
+                *(external.fetch(client, URL) for _ in range(count)),
+                return_exceptions=True)
+        return [result.status_code for result in results]
+
+    return asyncio.run(run())
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def setUp(self):
+        external.circuit_breakers.clear()
+
+    def breaker(self):
+        return external.circuit_breakers["api.example.com"]
+
+    def expire_open_window(self):
+        self.breaker()["opened_at"] -= external.BREAKER_RESET_TIMEOUT
+
+    def test_success(self):
+        transport = UpstreamTransport(200)
+        self.assertEqual(fetch_status(transport), [200])
+        self.assertEqual(transport.calls, 1)
+
+    def test_502_once_retries_are_exhausted(self):
+        transport = UpstreamTransport(503)
+        self.assertEqual(fetch_status(transport), [502])
+        self.assertEqual(transport.calls, 3)
+        self.assertIsNone(self.breaker()["opened_at"])
+
+    def test_client_errors_are_not_retried(self):
+        transport = UpstreamTransport(404)
+        self.assertEqual(fetch_status(transport), [404])
+        self.assertEqual(transport.calls, 1)
+
+    def test_opens_after_fail_max(self):
+        transport = UpstreamTransport(503)
+        fetch_status(transport)
+        # the second fetch trips the breaker and stops retrying
+        self.assertEqual(fetch_status(transport), [503])
+        self.assertEqual(transport.calls, external.BREAKER_FAIL_MAX)
+        self.assertIsNotNone(self.breaker()["opened_at"])
+
+    def test_fails_fast_while_open(self):
+        fetch_status(UpstreamTransport(503), count=external.BREAKER_FAIL_MAX)
+        transport = UpstreamTransport(200)
+        self.assertEqual(fetch_status(transport, count=3), [503, 503, 503])
+        self.assertEqual(transport.calls, 0)
+
+    def test_concurrent_failures_open_the_circuit(self):
+        transport = UpstreamTransport(503, delay=0.05)
+        self.assertEqual(fetch_status(transport, count=20), [503] * 20)
+        self.assertEqual(transport.calls, 20)
+
+    def test_single_trial_after_reset_timeout(self):
+        fetch_status(UpstreamTransport(503), count=external.BREAKER_FAIL_MAX)
+        self.expire_open_window()
+
+        transport = UpstreamTransport(503, delay=0.05)
+        self.assertEqual(fetch_status(transport, count=5), [503] * 5)
+        self.assertEqual(transport.calls, 1)
+
+        # the failed trial reopened the circuit
+        transport = UpstreamTransport(200)
+        self.assertEqual(fetch_status(transport), [503])
+        self.assertEqual(transport.calls, 0)
+
+    def test_successful_trial_closes_the_circuit(self):
+        fetch_status(UpstreamTransport(503), count=external.BREAKER_FAIL_MAX)
+        self.expire_open_window()
+
+        transport = UpstreamTransport(200)
+        self.assertEqual(fetch_status(transport), [200])
+        self.assertEqual(fetch_status(transport), [200])
+        self.assertEqual(transport.calls, 2)
+        self.assertEqual(self.breaker()["failures"], 0)
+        self.assertIsNone(self.breaker()["opened_at"])
+
+
+JOBS_PAGE = b"""
+<div id="searchCountPages">Page 1 of 3 jobs</div>
+<div class="jobsearch-SerpJobCard"><h2><a title="A" href="/rc/clk?jk=1">A</a></h2><div class="summary">a</div></div>
+<div class="jobsearch-SerpJobCard"><h2><a title="B" href="/rc/clk?jk=2">B</a></h2><div class="summary">b</div></div>
+<div class="jobsearch-SerpJobCard"><h2><a title="C" href="/rc/clk?jk=3">C</a></h2><div class="summary">c</div></div>
+"""
+
+class TestJobDetailPages(unittest.TestCase):
+    def setUp(self):
+        external.circuit_breakers.clear()
+        self.requests = []
+
+        def indeed(request):
+            self.requests.append(request.url.path)
+            if request.url.path == "/jobs":
+                return httpx.Response(200, content=JOBS_PAGE)
+            return httpx.Response(429)
+
+        self.client = external.client
+        external.client = httpx.AsyncClient(transport=httpx.MockTransport(indeed))
+
+    def tearDown(self):
+        external.client = self.client
+
+    def search(self, full_description):
+        city = City(city="New York", state="NY")
+        return asyncio.run(external.job_opportunities("accountant", city, full_description))
+
+    def test_failed_detail_pages_keep_summaries(self):
+        jobs = self.search(full_description=True)
+        descriptions = [record['Description'] for record in jobs["Top 10 Listings"]]
+        self.assertEqual(descriptions, ['a', 'b', 'c'])
+        # one attempt per detail page, no retries
+        self.assertEqual(self.requests.count("/rc/clk"), 3)
+
+    def test_failed_detail_pages_do_not_open_search_circuit(self):
+        for _ in range(2):
+            self.search(full_description=True)
+        self.assertEqual(external.circuit_breakers["www.indeed.com"]["failures"], 0)
+        self.assertIsNone(external.circuit_breakers["www.indeed.com"]["opened_at"])
+
+        jobs = self.search(full_description=False)
+        self.assertEqual(jobs["Search Results"], '3 jobs')
@@ -0,0 +1,54 @@
+import asyncio
+import os
+import unittest
+
+import httpx
+
+# app modules read these at import time
+os.environ.setdefault("DATABASE_URL", "postgresql://localhost/cityspire")
+os.environ.setdefault("RENTAL_API_KEY", "test")
+
+from app import external
+from app.ml import City
+from app.tests.test_caching import WEATHER
+from app.tests.test_circuit_breaker import JOBS_PAGE
+
+
+class TestCityDashboard(unittest.TestCase):
+    def setUp(self):
+        external.circuit_breakers.clear()
+        external.fetch_weather.cache_clear()
+
+        def upstream(request):
+            if request.url.host == "api.openweathermap.org":
+                return httpx.Response(200, json=WEATHER)
+            if request.url.path == "/jobs":
+                return httpx.Response(200, content=JOBS_PAGE)
+            return httpx.Response(503)
+
+        self.clients = external.client, external.rapid_client
+        external.client = httpx.AsyncClient(transport=httpx.MockTransport(upstream))
+        external.rapid_client = httpx.AsyncClient(transport=httpx.MockTransport(upstream))
+
+    def tearDown(self):
+        external.client, external.rapid_client = self.clients
+        external.fetch_weather.cache_clear()
+
+    def dashboard(self):
+        city = City(city="New York", state="NY")
+        return asyncio.run(external.city_dashboard("accountant", city))
+
+    def test_failed_upstream_keeps_other_sections(self):
+        dashboard = self.dashboard()
+        self.assertEqual(dashboard["Weather"]["Description"], "clear sky")
+        self.assertEqual(dashboard["Jobs"]["Search Results"], "3 jobs")
+        self.assertIsNone(dashboard["Rentals"])
+        self.assertEqual(dashboard["Errors"], {
+            "Rentals": "realtor-com-real-estate.p.rapidapi.com did not respond"})
+
+    def test_no_errors_when_all_upstreams_succeed(self):
+        external.rapid_client = httpx.AsyncClient(transport=httpx.MockTransport(
+            lambda request: httpx.Response(200, json={"data": {"results": []}})))
+        dashboard = self.dashboard()
+        self.assertEqual(dashboard["Rentals"], [])
+        self.assertEqual(dashboard["Errors"], {})
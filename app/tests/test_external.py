@@ -1,4 +1,3 @@
-import os
 import requests
 import json
 from jsonschema import validate
@@ -96,7 +95,6 @@ def test_job_opportunities_validates_json_resonse_schema():
 # Rental Listing Test
 def test_rental_listing_check_status_code_equals_200():
     data = {
-        "api_key": os.getenv("RENTAL_API_KEY"),
         "city": "New York",
         "state": "NY",
         "beds_min": 1,
@@ -124,7 +122,6 @@ rental_listings_schema = {
 
 def test_rental_listing_validates_json_response_schema():
     data = {
-        "api_key": os.getenv("RENTAL_API_KEY"),
         "city": "New York",
         "state": "NY",
         "beds_min": 1,
@@ -146,6 +143,15 @@ def test_rental_listing_validates_json_response_schema():
     # what is described in schema.
     validate(instance=resp_body, schema=rental_listings_schema)
 
+# City Dashboard Test
+def test_city_dashboard_check_status_code_equals_200():
+    data = {
+        "city": "New York",
+        "state": "NY"
+    }
+    response = requests.post("http://127.0.0.1:8000/api/city_dashboard?position=senior+accountant", json=data)
+    assert response.status_code == 200
+
 # School Listings Test
 def test_school_listings_check_status_code_equals_200():
     data = {
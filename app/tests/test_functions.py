@@ -1,5 +1,20 @@
+import asyncio
+import os
 import unittest
 
+import httpx
+import orjson
+
+# app modules read these at import time
+os.environ.setdefault("DATABASE_URL", "postgresql://localhost/cityspire")
+os.environ.setdefault("RENTAL_API_KEY", "test")
+
+from app import external
+from app.external import get_rental, parse_jobs
+from fastapi import HTTPException
+from app.data.files.state_abbr import to_abbr
+from app.ml import City, normalize_city, validate_city
+
 def parse_grades(grades_string):
     GRADES = ['PK', 'K', '1', '2', '3', '4', '5', '6', '7', '8', '9', '10', '11', '12', 'Ungraded']
 
@@ -138,4 +153,146 @@ class TestParseGrades(unittest.TestCase):
         for i in unique_grades_combination:
             separated_grades_list.append(parse_grades(i))
 
-        return separated_grades_list
\ No newline at end of file
+        return separated_grades_list
+
+
+JOBS_PAGE = b"""
+<div id="searchCountPages">Page 1 of 1,148 jobs</div>
+<div class="jobsearch-SerpJobCard unifiedRow row result">
+  <h2 class="title"><a title="Associate Data Scientist" href="/rc/clk?jk=285f">Associate Data Scientist</a></h2>
+  <span class="company"> Gap Inc. </span>
+  <div class="recJobLoc" data-rc-loc="San Francisco, CA"></div>
+  <div class="summary"> Experience in statistics. </div>
+  <span class="date">2 days ago</span>
+  <span class="salarytext"> $90,000 a year </span>
+</div>
+<div class="jobsearch-SerpJobCard unifiedRow row result">
+  <span class="company">No Link Co</span>
+</div>
+"""
+
+class TestParseJobs(unittest.TestCase):
+    def test_full_card(self):
+        record = parse_jobs(JOBS_PAGE)["Top 10 Listings"][0]
+        self.assertEqual(record['Job Title'], 'Associate Data Scientist')
+        self.assertEqual(record['Company'], 'Gap Inc.')
+        self.assertEqual(record['Location'], 'San Francisco, CA')
+        self.assertEqual(record['Date Posted'], '2 days ago')
+        self.assertEqual(record['Description'], 'Experience in statistics.')
+        self.assertEqual(record['Salary'], '$90,000 a year')
+        self.assertEqual(record['Job Url'], 'https://www.indeed.com/rc/clk?jk=285f')
+
+    def test_card_without_link(self):
+        record = parse_jobs(JOBS_PAGE)["Top 10 Listings"][1]
+        self.assertEqual(record['Job Title'], '')
+        self.assertEqual(record['Company'], 'No Link Co')
+        self.assertEqual(record['Location'], '')
+        self.assertEqual(record['Salary'], '')
+        self.assertEqual(record['Job Url'], '')
+
+    def test_search_count(self):
+        self.assertEqual(parse_jobs(JOBS_PAGE)["Search Results"], '1,148 jobs')
+
+    def test_missing_search_count(self):
+        page = JOBS_PAGE.replace(b'<div id="searchCountPages">Page 1 of 1,148 jobs</div>', b'')
+        jobs = parse_jobs(page)
+        self.assertEqual(jobs["Search Results"], '')
+        self.assertEqual(len(jobs["Top 10 Listings"]), 2)
+
+
+def rental_result(**overrides):
+    result = {
+        'location': {'address': {
+            'coordinate': {'lat': 37.775874, 'lon': -122.414746},
+            'line': '1321 Mission St',
+            'city': 'San Francisco',
+            'state': 'California'}},
+        'description': {'beds_max': 3, 'baths_max': 1},
+        'pet_policy': {'cats': True, 'dogs': False},
+        'list_price_max': 2750,
+        'tags': ['dishwasher'],
+        'photos': [{'href': 'https://ar.rdcpix.com/a.jpg'}]}
+    result.update(overrides)
+    return result
+
+class TestGetRental(unittest.TestCase):
+    def test_full_result(self):
+        rental = get_rental(rental_result())
+        self.assertEqual(rental['Latitude'], 37.775874)
+        self.assertEqual(rental['Street Address'], '1321 Mission St')
+        self.assertEqual(rental['Bedrooms'], 3)
+        self.assertEqual(rental['Bathrooms'], 1)
+        self.assertEqual(rental['Cats Allowed'], True)
+        self.assertEqual(rental['Dogs Allowed'], False)
+        self.assertEqual(rental['List Price'], 2750)
+        self.assertEqual(rental['Ammenities'], ['dishwasher'])
+
+    def test_null_pet_policy_and_description(self):
+        rental = get_rental(rental_result(pet_policy=None, description=None))
+        self.assertEqual(rental['Cats Allowed'], 'Unknown')
+        self.assertEqual(rental['Dogs Allowed'], 'Unknown')
+        self.assertEqual(rental['Bedrooms'], 0)
+        self.assertEqual(rental['Bathrooms'], 0)
+
+    def test_missing_tags_and_photos(self):
+        result = rental_result()
+        del result['tags'], result['photos']
+        rental = get_rental(result)
+        self.assertEqual(rental['Ammenities'], [])
+        self.assertIsNone(rental['Photos'])
+
+    def test_fewer_results_than_limit(self):
+        body = orjson.dumps({'data': {'results': [rental_result(), rental_result()]}})
+        transport = httpx.MockTransport(lambda request: httpx.Response(200, content=body))
+
+        rapid_client = external.rapid_client
+        external.rapid_client = httpx.AsyncClient(transport=transport)
+        try:
+            rentals = asyncio.run(external.rental_listing(City(city='San Francisco', state='CA'), limit=5))
+        finally:
+            external.rapid_client = rapid_client
+
+        self.assertEqual(len(rentals), 2)
+
+
+class TestValidateCity(unittest.TestCase):
+    def test_full_state_name(self):
+        city = validate_city(City(city='san francisco', state='california'))
+        self.assertEqual((city.city, city.state), ('San Francisco', 'CA'))
+
+    def test_state_abbr(self):
+        city = validate_city(City(city='new york', state='ny'))
+        self.assertEqual((city.city, city.state), ('New York', 'NY'))
+
+    def test_unknown_state(self):
+        with self.assertRaises(HTTPException) as raised:
+            validate_city(City(city='Springfield', state='Atlantis'))
+        self.assertEqual(raised.exception.status_code, 422)
+
+    def test_normalization_is_cached(self):
+        normalize_city.cache_clear()
+        validate_city(City(city='Austin', state='Texas'))
+        validate_city(City(city='Austin', state='Texas'))
+        self.assertEqual(normalize_city.cache_info().hits, 1)
+
+    def test_unknown_state_is_not_cached(self):
+        normalize_city.cache_clear()
+        for _ in range(2):
+            with self.assertRaises(HTTPException):
+                normalize_city('Springfield', 'Atlantis')
+        self.assertEqual(normalize_city.cache_info().currsize, 0)
+
+
+class TestToAbbr(unittest.TestCase):
+    def test_any_case(self):
+        self.assertEqual(to_abbr('new york'), 'NY')
+        self.assertEqual(to_abbr('NEW YORK'), 'NY')
+        self.assertEqual(to_abbr(' New York '), 'NY')
+
+    def test_district_of_columbia(self):
+        self.assertEqual(to_abbr('District of Columbia'), 'DC')
+        self.assertEqual(validate_city(City(city='washington', state='district of columbia')).state, 'DC')
+
+    def test_unknown_state(self):
+        with self.assertRaises(KeyError):
+            to_abbr('Atlantis')